@@ -11,14 +11,191 @@ import six
 from six.moves import map
 from six.moves import range
 
+import random
 import sympy
+from bisect import bisect_left, bisect_right
 from itertools import combinations
+from math import log
+
+try:
+    from math import gcd
+except ImportError:     # Python 2
+    from fractions import gcd as _fractions_gcd
+
+    def gcd(a, b):
+        return abs(_fractions_gcd(a, b))
 
 from mathics.builtin.base import Builtin, Test
 from mathics.core.expression import (
     Expression, Integer, Rational, Symbol, from_python)
 
 
+# Atoms returned on hot paths of Listable builtins, created only once.
+_TRUE = Symbol('True')
+_FALSE = Symbol('False')
+_ZERO = Integer(0)
+_COMPLEX_INFINITY = Symbol('ComplexInfinity')
+_SMALL_INTEGERS = [Integer(i) for i in range(-256, 257)]
+
+
+def _lcm(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return abs(a * b) // gcd(a, b)
+
+
+# Primality of small integers is answered from a sieve of Eratosthenes which
+# is built on first use. Only odd numbers are stored: _sieve[i] is nonzero iff
+# 2 * i + 1 is prime.
+_SIEVE_LIMIT = 1 << 20
+_sieve = None
+_small_primes = None
+_primorial = None
+
+
+def _get_sieve():
+    global _sieve
+    if _sieve is None:
+        size = _SIEVE_LIMIT // 2
+        sieve = bytearray([1]) * size
+        sieve[0] = 0
+        i = 1
+        while (2 * i + 1) ** 2 < _SIEVE_LIMIT:
+            if sieve[i]:
+                p = 2 * i + 1
+                start = p * p // 2
+                sieve[start::p] = bytearray((size - 1 - start) // p + 1)
+            i += 1
+        _sieve = sieve
+    return _sieve
+
+
+def _get_small_primes():
+    'Sorted list of all primes below _SIEVE_LIMIT.'
+    global _small_primes
+    if _small_primes is None:
+        sieve = _get_sieve()
+        _small_primes = [2] + [2 * i + 1 for i in range(1, len(sieve))
+                               if sieve[i]]
+    return _small_primes
+
+
+def _get_primorial():
+    '''
+    Product of all primes below 1000. A single gcd with it rejects about
+    84% of all larger odd numbers before a Miller-Rabin test.
+    '''
+    global _primorial
+    if _primorial is None:
+        small_primes = _get_small_primes()
+        product = 1
+        for p in small_primes[:bisect_left(small_primes, 1000)]:
+            product *= p
+        _primorial = product
+    return _primorial
+
+
+def _nth_prime(n):
+    small_primes = _get_small_primes()
+    if n <= len(small_primes):
+        return small_primes[n - 1]
+    return sympy.prime(n)
+
+
+# Bases for which a strong probable prime test is exact for all n < 2^64
+# (Jim Sinclair's set).
+_MILLER_RABIN_BASES = (2, 325, 9375, 28178, 450775, 9780504, 1795265022)
+
+
+def _is_prime_u64(n):
+    'Deterministic Miller-Rabin test for odd n with 2 < n < 2^64.'
+    d = n - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    for a in _MILLER_RABIN_BASES:
+        a %= n
+        if a == 0:
+            continue
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for i in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _is_prime(n):
+    'Primality test for nonnegative integers.'
+    if n < _SIEVE_LIMIT:
+        if n < 3:
+            return n == 2
+        return n & 1 == 1 and _get_sieve()[n >> 1] != 0
+    if gcd(n, _get_primorial()) != 1:
+        return False
+    if n < 1 << 64:
+        return _is_prime_u64(n)
+    return sympy.isprime(n)
+
+
+def _primes_in_range(lo, hi):
+    '''
+    Sorted list of all primes p with lo <= p <= hi. Requires
+    hi < _SIEVE_LIMIT ** 2.
+    '''
+    small_primes = _get_small_primes()
+    if hi < _SIEVE_LIMIT:
+        return small_primes[bisect_left(small_primes, lo):
+                            bisect_right(small_primes, hi)]
+
+    primes = small_primes[bisect_left(small_primes, lo):]
+
+    # sieve the odd numbers in [start, hi] with the primes up to sqrt(hi);
+    # segment[i] corresponds to start + 2 * i
+    start = max(lo, _SIEVE_LIMIT) | 1
+    if start > hi:
+        return primes
+    size = (hi - start) // 2 + 1
+    segment = bytearray([1]) * size
+    for k in range(1, len(small_primes)):
+        p = small_primes[k]
+        if p * p > hi:
+            break
+        first = -(-start // p) * p
+        if first % 2 == 0:
+            first += p
+        i = (first - start) // 2
+        if i < size:
+            segment[i::p] = bytearray((size - 1 - i) // p + 1)
+    primes.extend(start + 2 * i for i in range(size) if segment[i])
+    return primes
+
+
+# Offsets within a block of 210 = 2 * 3 * 5 * 7 numbers that can hold a
+# prime: the 48 residues coprime to 210, plus 2, 3, 5 and 7 themselves.
+_WHEEL_OFFSETS = [2, 3, 5, 7] + [r for r in range(210) if gcd(r, 210) == 1]
+
+
+def _random_prime(lo, hi):
+    '''
+    Uniformly distributed random prime in [lo, hi], found by rejection
+    sampling. The interval must contain at least one prime.
+    '''
+    # Candidates are drawn from the wheel, so that multiples of 2, 3, 5 and
+    # 7 are never tested. Every prime in the interval is hit by exactly one
+    # (block, offset) pair, which keeps the distribution uniform.
+    randint, choice, is_prime = random.randint, random.choice, _is_prime
+    first_block, last_block = lo // 210, hi // 210
+    while True:
+        candidate = 210 * randint(first_block, last_block) + \
+            choice(_WHEEL_OFFSETS)
+        if lo <= candidate <= hi and is_prime(candidate):
+            return candidate
+
+
 class PowerMod(Builtin):
     """
     <dl>
@@ -37,6 +214,19 @@ class PowerMod(Builtin):
      : The argument 0 should be nonzero.
      = PowerMod[5, 2, 0]
 
+    #> PowerMod[3, 10 ^ 20 + 1, 1024]
+     = 3
+    #> PowerMod[6, 100, 1024]
+     = 0
+    #> PowerMod[6, 5, 1024]
+     = 608
+    #> PowerMod[-7, 12345, 64]
+     = 57
+    #> PowerMod[2, 9, 1024]
+     = 512
+    #> PowerMod[5, 0, 1]
+     = 0
+
     'PowerMod' does not support rational coefficients (roots) yet.
     """
 
@@ -62,6 +252,15 @@ class PowerMod(Builtin):
             except sympy.polys.polyerrors.NotInvertible:
                 evaluation.message('PowerMod', 'ninv', a_int, m_int)
                 return
+        if m > 0 and m & (m - 1) == 0:
+            # m = 2^k: even powers vanish once they contain k factors of 2,
+            # and the group of units modulo 2^k has exponent 2^(k-2)
+            k = m.bit_length() - 1
+            if a % 2 == 0:
+                if a != 0 and ((a & -a).bit_length() - 1) * b >= k:
+                    return _ZERO
+            elif k > 2:
+                b &= (1 << (k - 2)) - 1
         return Integer(pow(a, b, m))
 
 
@@ -145,6 +344,11 @@ class GCD(Builtin):
     >> GCD[10, y]
      = GCD[10, y]
 
+    #> GCD[-12, 18, 0]
+     = 6
+    #> GCD[4, 9, 12, 16]
+     = 1
+
     'GCD' is 'Listable':
     >> GCD[4, {10, 11, 12, 13, 14}]
      = {2, 1, 4, 1, 2}
@@ -158,12 +362,20 @@ class GCD(Builtin):
         'GCD[ns___Integer]'
 
         ns = ns.get_sequence()
+        if len(ns) == 2:
+            a, b = ns[0].get_int_value(), ns[1].get_int_value()
+            if a is not None and b is not None:
+                return Integer(gcd(a, b))
+
         result = 0
         for n in ns:
             value = n.get_int_value()
             if value is None:
                 return
-            result = sympy.gcd(result, value)
+            result = gcd(result, value)
+            if result == 1:
+                # no further argument can change the result
+                break
         return Integer(result)
 
 # FIXME: Previosuly this used gmpy's gcdext. sympy's gcdex is not as powerful
@@ -216,6 +428,11 @@ class LCM(Builtin):
      = 60
     >> LCM[20, 30, 40, 50]
      = 600
+
+    #> LCM[-4, 6]
+     = 12
+    #> LCM[0, 5]
+     = 0
     """
 
     attributes = ('Flat', 'Listable', 'OneIdentity', 'Orderless')
@@ -224,12 +441,17 @@ class LCM(Builtin):
         'LCM[ns___Integer]'
 
         ns = ns.get_sequence()
+        if len(ns) == 2:
+            a, b = ns[0].get_int_value(), ns[1].get_int_value()
+            if a is not None and b is not None:
+                return Integer(_lcm(a, b))
+
         result = 1
         for n in ns:
             value = n.get_int_value()
             if value is None:
                 return
-            result = sympy.lcm(result, value)
+            result = _lcm(result, value)
         return Integer(result)
 
 
@@ -258,21 +480,18 @@ class FactorInteger(Builtin):
 
         if isinstance(n, Integer):
             factors = sympy.factorint(n.value)
-            factors = sorted(six.iteritems(factors))
-            return Expression('List', *(Expression('List', factor, exp)
-                                        for factor, exp in factors))
-
         elif isinstance(n, Rational):
             factors, factors_denom = list(map(
                 sympy.factorint, n.value.as_numer_denom()))
-            for factor, exp in six.iteritems(factors_denom):
+            for factor, exp in factors_denom.items():
                 factors[factor] = factors.get(factor, 0) - exp
-            factors = sorted(six.iteritems(factors))
-            return Expression('List', *(Expression('List', factor, exp)
-                                        for factor, exp in factors))
         else:
             return evaluation.message('FactorInteger', 'exact', n)
 
+        return Expression('List', *[
+            Expression('List', Integer(factor), Integer(exp))
+            for factor, exp in sorted(factors.items())])
+
 
 class IntegerExponent(Builtin):
     """
@@ -289,6 +508,18 @@ class IntegerExponent(Builtin):
 
     >> IntegerExponent[10, b]
      = IntegerExponent[10, b]
+
+    #> IntegerExponent[2 ^ 100 3 ^ 7, 3]
+     = 7
+    #> IntegerExponent[-96, 2]
+     = 5
+    #> IntegerExponent[7 ^ 50, 7]
+     = 50
+    #> IntegerExponent[0, 7]
+     = Infinity
+    #> IntegerExponent[10, 1]
+     : Base 1 is not an integer greater than 1.
+     = IntegerExponent[10, 1]
     """
 
     rules = {
@@ -310,17 +541,15 @@ class IntegerExponent(Builtin):
             evaluation.message('IntegerExponent', 'int', expr)
         py_n = abs(py_n)
 
-        if not (isinstance(py_b, int) and py_b > 1):
+        if not (isinstance(py_b, six.integer_types) and py_b > 1):
             evaluation.message('IntegerExponent', 'ibase', b)
+            return
 
-        # TODO: Optimise this (dont need to calc. base^result)
-        # NOTE: IntegerExponent[a,b] causes a Python error here when a or b are
-        # symbols
-        result = 1
-        while py_n % (py_b ** result) == 0:
-            result += 1
+        if py_n == 0:
+            return Symbol('Infinity')
 
-        return from_python(result - 1)
+        # multiplicity divides by successively squared powers of the base
+        return from_python(sympy.ntheory.multiplicity(py_b, py_n))
 
 
 class Prime(Builtin):
@@ -335,6 +564,11 @@ class Prime(Builtin):
 
     >> Prime[167]
      = 991
+
+    #> Prime[82025]
+     = 1048573
+    #> Prime[82026]
+     = 1048583
     """
 
     messages = {
@@ -344,8 +578,8 @@ class Prime(Builtin):
     def apply(self, n, evaluation):
         'Prime[n_]'
         n_int = n.to_python()
-        if isinstance(n_int, int) and n_int > 0:
-            return Integer(sympy.prime(n_int))
+        if isinstance(n_int, six.integer_types) and n_int > 0:
+            return Integer(_nth_prime(n_int))
 
         expr = Expression('Prime', n)
         evaluation.message('Prime', 'intpp', expr)
@@ -376,6 +610,10 @@ class PrimeQ(Builtin):
      = False
     #> PrimeQ[2 ^ 255 - 1]
      = False
+    #> PrimeQ[{0, 1048573, 1048575, 1048583}]
+     = {False, True, False, True}
+    #> PrimeQ[{3215031751, 3825123056546413051, 2 ^ 61 - 1, 2 ^ 64 - 59}]
+     = {False, False, True, True}
 
     All prime numbers between 1 and 100:
     >> Select[Range[100], PrimeQ]
@@ -393,13 +631,13 @@ class PrimeQ(Builtin):
 
         n = n.get_int_value()
         if n is None:
-            return Symbol('False')
+            return _FALSE
 
         n = abs(n)
-        if sympy.isprime(n):
-            return Symbol('True')
+        if _is_prime(n):
+            return _TRUE
         else:
-            return Symbol('False')
+            return _FALSE
 
 
 class CoprimeQ(Builtin):
@@ -431,6 +669,13 @@ class CoprimeQ(Builtin):
 
     >> CoprimeQ[2, 4, 5]
      = False
+
+    #> CoprimeQ[6, 35, 143, 13]
+     = False
+    #> CoprimeQ[0, 1]
+     = True
+    #> CoprimeQ[0, 2]
+     = False
     """
     attributes = ('Listable',)
 
@@ -440,12 +685,22 @@ class CoprimeQ(Builtin):
         py_args = [arg.to_python() for arg in args.get_sequence()]
         if not all(isinstance(i, int) or isinstance(i, complex)
                    for i in py_args):
-            return Symbol('False')
+            return _FALSE
+
+        if all(isinstance(i, six.integer_types) for i in py_args):
+            # the arguments are pairwise coprime iff each one is coprime to
+            # the product of all preceding ones
+            product = 1
+            for value in py_args:
+                if gcd(product, value) != 1:
+                    return _FALSE
+                product *= value
+            return _TRUE
 
         if all(sympy.gcd(n, m) == 1 for (n, m) in combinations(py_args, 2)):
-            return Symbol('True')
+            return _TRUE
         else:
-            return Symbol('False')
+            return _FALSE
 
 
 class PrimePowerQ(Builtin):
@@ -499,13 +754,13 @@ class PrimePowerQ(Builtin):
         'PrimePowerQ[n_]'
         n = n.get_int_value()
         if n is None:
-            return Symbol('False')
+            return _FALSE
 
         n = abs(n)
-        if len(sympy.factorint(n)) == 1:
-            return Symbol('True')
+        if _is_prime(n) or len(sympy.factorint(n)) == 1:
+            return _TRUE
         else:
-            return Symbol('False')
+            return _FALSE
 
 
 class PrimePi(Builtin):
@@ -526,13 +781,22 @@ class PrimePi(Builtin):
 
     >> PrimePi[E]
      = 1
+
+    #> PrimePi[1048573]
+     = 82025
+    #> PrimePi[1048583]
+     = 82026
     """
 
     # TODO: Traditional Form
 
     def apply(self, n, evaluation):
         'PrimePi[n_?NumericQ]'
-        result = sympy.ntheory.primepi(n.to_python(n_evaluation=evaluation))
+        py_n = n.to_python(n_evaluation=evaluation)
+        if isinstance(py_n, six.integer_types + (float,)) and \
+                py_n < _SIEVE_LIMIT:
+            return Integer(bisect_right(_get_small_primes(), py_n))
+        result = sympy.ntheory.primepi(py_n)
         return from_python(result)
 
 
@@ -554,6 +818,21 @@ class NextPrime(Builtin):
     >> NextPrime[10, -5]
     = -2
 
+    #> NextPrime[10, -6]
+     = -3
+    #> NextPrime[11]
+     = 13
+    #> NextPrime[10, 0]
+     = 11
+    #> NextPrime[1048573]
+     = 1048583
+    #> NextPrime[-10, -2]
+     = -13
+    #> NextPrime[1000, -168]
+     = 2
+    #> NextPrime[7.5, -2]
+     = 5
+
     >> NextPrime[100, 5]
      = 113
 
@@ -573,9 +852,28 @@ class NextPrime(Builtin):
         py_k = k.to_python(n_evaluation=evaluation)
         py_n = n.to_python(n_evaluation=evaluation)
 
+        if isinstance(py_n, six.integer_types + (float,)) and \
+                0 <= py_n < _SIEVE_LIMIT:
+            small_primes = _get_small_primes()
+            if py_k < 0:
+                below = bisect_left(small_primes, py_n)
+                if below + py_k >= 0:
+                    return Integer(small_primes[below + py_k])
+                # continue with the negated primes -2, -3, -5, ...
+                return Integer(-_nth_prime(-py_k - below))
+
+            # like sympy's nextprime, treat k = 0 as k = 1
+            index = bisect_right(small_primes, py_n) + max(py_k, 1) - 1
+            if index < len(small_primes):
+                return Integer(small_primes[index])
+
         if py_k >= 0:
             return from_python(sympy.ntheory.nextprime(py_n, py_k))
 
+        if py_n < 0:
+            # the primes below -m are the negated primes above m
+            return from_python(-sympy.ntheory.nextprime(-py_n, -py_k))
+
         # Hack to get earlier primes
         result = n.to_python()
         for i in range(-py_k):
@@ -583,7 +881,7 @@ class NextPrime(Builtin):
                 result = sympy.ntheory.prevprime(result)
             except ValueError:
                 # No earlier primes
-                return from_python(-1 * sympy.ntheory.nextprime(0, py_k - i))
+                return Integer(-_nth_prime(-py_k - i))
 
         return from_python(result)
 
@@ -617,6 +915,27 @@ class RandomPrime(Builtin):
 
     #> RandomPrime[2, {3,2}]
      = {{2, 2}, {2, 2}, {2, 2}}
+
+    #> RandomPrime[{2 ^ 30 + 20, 2 ^ 30 + 40}, 2]
+     = {1073741857, 1073741857}
+    #> RandomPrime[{1, 2, 3}]
+     : First argument {1, 2, 3} is not a positive integer or a list of two positive integers.
+     = RandomPrime[{1, 2, 3}, 1]
+    #> RandomPrime[{x, 10}]
+     : The paramater x describing the interval is expected to be a positive integer.
+     = RandomPrime[{x, 10}, 1]
+    #> MemberQ[{11, 13, 17, 19}, RandomPrime[{20, 10}]]
+     = True
+    #> RandomPrime[{2 ^ 30 + 42, 2 ^ 30 + 50}, 2]
+     : There are no primes in the specified interval.
+     = RandomPrime[{1073741866, 1073741874}, 2]
+    #> RandomPrime[{2 ^ 61 + 50, 2 ^ 61 + 60}]
+     = 2305843009213694009
+    #> RandomPrime[{2 ^ 61 + 22, 2 ^ 61 + 56}]
+     : There are no primes in the specified interval.
+     = RandomPrime[{2305843009213693974, 2305843009213694008}, 1]
+    #> PrimeQ[RandomPrime[{1, 10 ^ 20}, 5]]
+     = {True, True, True, True, True}
     """
 
     messages = {
@@ -647,29 +966,60 @@ class RandomPrime(Builtin):
         if not isinstance(n, Integer):
             evaluation.message('RandomPrime', 'posdim', n)
             return
-        py_n = n.to_python()
+        py_n = n.get_int_value()
 
-        py_int = interval.to_python()
-        if not (isinstance(py_int, list) and len(py_int) == 2):
+        if len(interval.leaves) != 2:
             evaluation.message('RandomPrime', 'prmrng', interval)
+            return
 
-        imin, imax = min(py_int), max(py_int)
-        if imin <= 0 or not isinstance(imin, int):
+        a, b = [leaf.get_int_value() for leaf in interval.leaves]
+        if a is None or a <= 0:
             evaluation.message('RandomPrime', 'posint', interval.leaves[0])
             return
 
-        if imax <= 0 or not isinstance(imax, int):
+        if b is None or b <= 0:
             evaluation.message('RandomPrime', 'posint', interval.leaves[1])
             return
 
-        try:
+        imin, imax = (a, b) if a <= b else (b, a)
+
+        # Below the sieve limit, pick indices into the prime table.
+        if imax < _SIEVE_LIMIT:
+            small_primes = _get_small_primes()
+            i = bisect_left(small_primes, imin)
+            j = bisect_right(small_primes, imax)
+            if i == j:
+                evaluation.message('RandomPrime', 'noprime')
+                return
+            randrange = random.randrange
+            if py_n == 1:
+                return Integer(small_primes[randrange(i, j)])
+            return Expression('List', *[Integer(small_primes[randrange(i, j)])
+                                        for k in range(py_n)])
+
+        # Sieve the interval once and draw from its primes if it is narrow
+        # compared to the number of samples. Otherwise search for each
+        # prime separately.
+        if imax < _SIEVE_LIMIT ** 2 and \
+                imax - imin < min(_SIEVE_LIMIT, 4 * py_n * log(imax)):
+            candidates = _primes_in_range(imin, imax)
+            if not candidates:
+                evaluation.message('RandomPrime', 'noprime')
+                return
+            choice = random.choice
             if py_n == 1:
-                return from_python(sympy.ntheory.randprime(imin, imax + 1))
-            return from_python([sympy.ntheory.randprime(imin, imax + 1)
-                                for i in range(py_n)])
-        except ValueError:
+                return Integer(choice(candidates))
+            return Expression('List', *[Integer(choice(candidates))
+                                        for i in range(py_n)])
+
+        if sympy.ntheory.nextprime(imin - 1) > imax:
             evaluation.message('RandomPrime', 'noprime')
             return
+        random_prime = _random_prime
+        if py_n == 1:
+            return Integer(random_prime(imin, imax))
+        return Expression('List', *[Integer(random_prime(imin, imax))
+                                    for i in range(py_n)])
 
 
 class Quotient(Builtin):
@@ -691,6 +1041,12 @@ class Quotient(Builtin):
      = 4
     #> Quotient[19, -4]
      = -5
+    #> Quotient[x, 2]
+     = Quotient[x, 2]
+    #> Quotient[{-2570, 2570, 2577, -2577}, 10]
+     = {-257, 257, 257, -258}
+    #> Quotient[7.5, 2]
+     = Quotient[7.5, 2]
     '''
 
     attributes = ('Listable', 'NumericFunction')
@@ -699,14 +1055,21 @@ class Quotient(Builtin):
         'infy': 'Infinite expression `1` encountered.',
     }
 
-    def apply(self, m, n, evaluation):
-        'Quotient[m_Integer, n_Integer]'
+    def apply(self, m, n, expression, evaluation):
+        'Quotient[m_, n_]'
+        # checking the types here is cheaper than matching m_Integer and
+        # n_Integer, which has to build the head of every argument
+        if not (isinstance(m, Integer) and isinstance(n, Integer)):
+            return
         py_m = m.get_int_value()
         py_n = n.get_int_value()
         if py_n == 0:
-            evaluation.message('Quotient', 'infy', Expression('Quotient', m, n))
-            return Symbol('ComplexInfinity')
-        return Integer(py_m // py_n)
+            evaluation.message('Quotient', 'infy', expression)
+            return _COMPLEX_INFINITY
+        q = py_m // py_n
+        if -256 <= q <= 256:
+            return _SMALL_INTEGERS[q + 256]
+        return Integer(q)
       
 class QuotientRemainder(Builtin):
     '''
@@ -56,7 +56,8 @@ except ImportError:
 else:
     EXTENSIONS = {
         'core': ['expression', 'numbers', 'rules', 'pattern'],
-        'builtin': ['arithmetic', 'numeric', 'patterns', 'graphics']
+        'builtin': ['arithmetic', 'numeric', 'numbertheory', 'patterns',
+                    'graphics']
     }
     EXTENSIONS = [
         Extension('mathics.%s.%s' % (parent, module),